@@ -1,44 +1,135 @@
 """Модуль управления браузером через Playwright."""
 
+from __future__ import annotations
+
+import asyncio
 import os
-from typing import Optional
+import sys
+from typing import TYPE_CHECKING, List, Optional
+
+from agent.page_analyzer import PageAnalyzer
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, BrowserContext, Frame, Page, Playwright
 
-from playwright.async_api import async_playwright, Browser, Page, Playwright
+# Расширения изображений, видео и шрифтов: они не нужны агенту и задерживают загрузку страниц.
+# Стили не блокируются: от них зависит видимость элементов при разметке DOM.
+BLOCKED_EXTENSIONS = (
+    "png", "jpg", "jpeg", "gif", "webp", "avif", "bmp", "ico",
+    "mp4", "webm", "ogg", "mp3", "wav",
+    "woff", "woff2", "ttf", "otf", "eot",
+)
+# Шаблоны URL для Network.setBlockedURLs (с query-строкой и без)
+BLOCKED_URL_PATTERNS = [pattern for ext in BLOCKED_EXTENSIONS for pattern in (f"*.{ext}", f"*.{ext}?*")]
 
 
 class BrowserController:
     """Управляет жизненным циклом браузера и взаимодействием со страницей."""
 
-    def __init__(self, headless: bool = False):
+    # Путь к системному Chrome, общий для всех экземпляров (ищется один раз)
+    _chrome_path_cache: Optional[str] = None
+    _chrome_path_probed = False
+
+    def __init__(
+        self,
+        headless: bool = False,
+        storage_state_path: Optional[str] = ".agent_state.json",
+        block_resources: bool = False,
+    ):
         """
         Инициализирует контроллер браузера.
 
         Args:
             headless: Запускать браузер в headless режиме или нет.
+            storage_state_path: Файл для сохранения cookies и localStorage между запусками
+                (None - не сохранять).
+            block_resources: Не загружать изображения, видео и шрифты (BLOCKED_EXTENSIONS).
         """
         self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
         self.playwright: Optional[Playwright] = None
         self.headless = headless
+        self.storage_state_path = storage_state_path
+        self.block_resources = block_resources
+        # DOMContentLoaded основной страницы уже наступил после последней навигации
+        self._dom_ready = False
 
-    def _find_system_chrome(self) -> Optional[str]:
+    @property
+    def dom_ready(self) -> bool:
+        """Готов ли DOM основной страницы (ожидание загрузки перед анализом не нужно)."""
+        return self._dom_ready
+
+    async def _block_heavy_resources(self, page: Page) -> None:
         """
-        Пытается найти системный Chrome на Windows.
+        Запрещает странице загружать ресурсы из BLOCKED_URL_PATTERNS.
+
+        Блокировка выполняется самим браузером через CDP: в отличие от page.route,
+        запросы не проходят через Python и HTTP-кеш остается включенным.
+        """
+        session = await self.context.new_cdp_session(page)
+        await session.send("Network.enable")
+        await session.send("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+
+    def _on_frame_navigated(self, frame: Frame) -> None:
+        """Сбрасывает готовность DOM при навигации основного фрейма."""
+        if frame.parent_frame is None:
+            self._dom_ready = False
+
+    def _on_dom_content_loaded(self, page: Page) -> None:
+        """Отмечает готовность DOM основной страницы."""
+        self._dom_ready = True
+
+    @staticmethod
+    def _query_chrome_registry() -> Optional[str]:
+        """
+        Читает путь к Chrome из реестра Windows (App Paths).
 
         Returns:
             Путь к Chrome или None.
         """
-        possible_paths = [
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-            os.path.expanduser(r"~\AppData\Local\Google\Chrome\Application\chrome.exe"),
-        ]
+        import winreg
 
-        for path in possible_paths:
-            if os.path.exists(path):
+        key_path = r"SOFTWARE\Microsoft\Windows\CurrentVersion\App Paths\chrome.exe"
+        for root in (winreg.HKEY_LOCAL_MACHINE, winreg.HKEY_CURRENT_USER):
+            try:
+                with winreg.OpenKey(root, key_path) as key:
+                    path, _ = winreg.QueryValueEx(key, "")
+            except OSError:
+                continue
+            if path and os.path.exists(path):
                 return path
         return None
 
+    def _find_system_chrome(self) -> Optional[str]:
+        """
+        Пытается найти системный Chrome на Windows.
+
+        Сначала читает путь из реестра, при неудаче проверяет стандартные папки установки.
+        Результат кешируется на уровне класса.
+
+        Returns:
+            Путь к Chrome или None.
+        """
+        cls = type(self)
+        if cls._chrome_path_probed:
+            return cls._chrome_path_cache
+
+        chrome_path = None
+        if sys.platform == "win32":
+            chrome_path = self._query_chrome_registry()
+            if not chrome_path:
+                possible_paths = [
+                    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+                    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+                    os.path.expanduser(r"~\AppData\Local\Google\Chrome\Application\chrome.exe"),
+                ]
+                chrome_path = next((path for path in possible_paths if os.path.exists(path)), None)
+
+        cls._chrome_path_cache = chrome_path
+        cls._chrome_path_probed = True
+        return chrome_path
+
     async def start(self) -> None:
         """
         Запускает браузер и создает новую страницу.
@@ -46,7 +137,12 @@ class BrowserController:
         Raises:
             Exception: Если не удалось запустить браузер.
         """
+        # Playwright импортируется при первом запуске браузера, чтобы не замедлять старт CLI
+        from playwright.async_api import async_playwright
+
         self.playwright = await async_playwright().start()
+        # Элементы, размеченные анализатором, ищутся через get_by_test_id
+        self.playwright.selectors.set_test_id_attribute("data-ai-id")
 
         # Проверяем, есть ли путь к системному Chrome в переменных окружения
         chrome_path = os.getenv("PLAYWRIGHT_CHROMIUM_EXECUTABLE_PATH")
@@ -70,21 +166,45 @@ class BrowserController:
             )
             raise RuntimeError(error_msg) from e
 
-        self.page = await self.browser.new_page()
+        # Восстанавливаем cookies и localStorage прошлого запуска, если они сохранены
+        storage_state = None
+        if self.storage_state_path and os.path.exists(self.storage_state_path):
+            storage_state = self.storage_state_path
+        self.context = await self.browser.new_context(storage_state=storage_state)
+        # Скрипты анализа устанавливаются один раз для всех страниц и переживают навигацию
+        await self.context.add_init_script(PageAnalyzer.get_init_script())
+        self.page = await self.context.new_page()
+        if self.block_resources:
+            await self._block_heavy_resources(self.page)
+        self.page.on("framenavigated", self._on_frame_navigated)
+        self.page.on("domcontentloaded", self._on_dom_content_loaded)
 
         # Устанавливаем таймауты
         self.page.set_default_timeout(30000)
         self.page.set_default_navigation_timeout(30000)
 
-    async def go_to(self, url: str) -> None:
+    async def go_to(self, url: str, strict_wait: bool = False) -> None:
         """
         Переходит по указанному URL.
 
         Args:
             url: URL для перехода.
+            strict_wait: Дождаться полного простоя сети (медленно на тяжелых страницах).
         """
-        if self.page:
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+        if not self.page:
+            return
+        if strict_wait:
             await self.page.goto(url, wait_until="networkidle")
+            self._dom_ready = True
+            return
+        try:
+            await self.page.goto(url, wait_until="domcontentloaded", timeout=10000)
+            self._dom_ready = True
+        except PlaywrightTimeoutError:
+            # Страница продолжает грузиться, но с ней уже можно работать
+            pass
 
     async def get_page_content(self) -> str:
         """
@@ -119,18 +239,79 @@ class BrowserController:
             return await self.page.title()
         return ""
 
-    async def wait_for_load(self, timeout: int = 30000) -> None:
+    async def wait_for_load(self, timeout: int = 30000, strict_wait: bool = False) -> None:
         """
         Ожидает загрузки страницы.
 
         Args:
             timeout: Таймаут ожидания в миллисекундах.
+            strict_wait: Ждать полного простоя сети вместо DOMContentLoaded.
         """
         if self.page:
-            await self.page.wait_for_load_state("networkidle", timeout=timeout)
+            state = "networkidle" if strict_wait else "domcontentloaded"
+            await self.page.wait_for_load_state(state, timeout=timeout)
+
+    async def open_pages(self, urls: List[str], concurrency: int = 10) -> List[Page]:
+        """
+        Открывает несколько страниц параллельно в общем контексте браузера.
+
+        Основная страница агента при этом не меняется. Страницы, которые не удалось
+        загрузить, все равно возвращаются, чтобы вызывающий код мог их закрыть.
+
+        Args:
+            urls: Список URL для открытия.
+            concurrency: Максимальное количество одновременно загружаемых страниц.
+
+        Returns:
+            Открытые страницы в том же порядке, что и URL.
+        """
+        from playwright.async_api import Error as PlaywrightError
+
+        if not self.context:
+            return []
+
+        semaphore = asyncio.Semaphore(concurrency)
+        opened: List[Page] = []
+
+        async def open_page(url: str) -> Page:
+            async with semaphore:
+                page = await self.context.new_page()
+                opened.append(page)
+                if self.block_resources:
+                    await self._block_heavy_resources(page)
+                try:
+                    await page.goto(url, wait_until="domcontentloaded", timeout=10000)
+                except PlaywrightError:
+                    # Таймаут или ошибка сети - анализируем то, что успело загрузиться
+                    pass
+                return page
+
+        # Дожидаемся всех задач, чтобы ни одна не открыла страницу после очистки
+        results = await asyncio.gather(*(open_page(url) for url in urls), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            # Вызывающий код не получит страницы, поэтому закрываем уже открытые здесь
+            await asyncio.gather(*(page.close() for page in opened), return_exceptions=True)
+            raise errors[0]
+        return list(results)
+
+    async def close_pages(self, pages: List[Page]) -> None:
+        """
+        Закрывает страницы, открытые через open_pages.
+
+        Args:
+            pages: Список страниц для закрытия.
+        """
+        await asyncio.gather(*(page.close() for page in pages))
 
     async def stop(self) -> None:
         """Закрывает браузер и освобождает ресурсы."""
+        if self.context and self.storage_state_path:
+            try:
+                await self.context.storage_state(path=self.storage_state_path)
+            except Exception:
+                # Не мешаем закрытию браузера, если состояние сохранить не удалось
+                pass
         if self.browser:
             await self.browser.close()
         if self.playwright:
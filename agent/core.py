@@ -1,24 +1,50 @@
 """Ядро AI-агента - мозговой центр системы."""
 
 import asyncio
+import functools
 import json
 import os
-from typing import Any, Dict, List
-
-from openai import (
-    AsyncOpenAI,
-    APIError,
-    AuthenticationError,
-    BadRequestError,
-    PermissionDeniedError,
-    RateLimitError,
-)
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from agent.browser_controller import BrowserController
 from agent.page_analyzer import PageAnalyzer
 from tools.tool_manager import ToolManager
 from utils.logger import setup_logger
 
+try:
+    import orjson
+except ImportError:  # orjson - необязательное ускорение, достаточно стандартного json
+    orjson = None
+
+# orjson.JSONDecodeError наследуется от json.JSONDecodeError, обработка ошибок одинакова
+_json_loads = orjson.loads if orjson else json.loads
+
+# Служебные токены, которые OpenAI добавляет к каждому сообщению
+TOKENS_PER_MESSAGE = 4
+# Доля бюджета контекста, оставляемая в запасе на погрешность подсчета
+CONTEXT_SAFETY_MARGIN = 0.1
+# Время жизни (в секундах) и размер кеша результатов читающих инструментов
+TOOL_CACHE_TTL = 2.0
+TOOL_CACHE_SIZE = 64
+# Сколько текстов помнить в кеше подсчета токенов
+TOKEN_COUNT_CACHE_SIZE = 512
+# Среднее число символов на токен для оценки, если кодировка tiktoken недоступна
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=1)
+def _load_system_prompt() -> str:
+    """Читает системный промпт из файла один раз за время работы процесса."""
+    system_prompt_path = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "prompts", "system_prompt.txt"
+    )
+    try:
+        with open(system_prompt_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return "Ты — автономный AI-агент, управляющий веб-браузером."
+
 
 class AICore:
     """Основной класс AI-агента, управляющий циклом принятия решений."""
@@ -27,30 +53,48 @@ class AICore:
         self,
         api_key: str,
         tool_manager: ToolManager,
-        max_context_messages: int = 30,
+        max_input_tokens: int = 100000,
     ):
         """
         Инициализирует ядро AI-агента.
+
+        Args:
+            api_key: Ключ OpenAI API.
+            tool_manager: Менеджер инструментов агента.
+            max_input_tokens: Бюджет токенов на историю сообщений в одном запросе.
         """
+        # openai и tiktoken импортируются при первом использовании, чтобы не замедлять запуск
+        import tiktoken
+        from openai import AsyncOpenAI
+
         self.client = AsyncOpenAI(api_key=api_key)
         self.tool_manager = tool_manager
         self.messages: List[Dict[str, Any]] = []
         self.logger = setup_logger("AICore")
+        self.model = "gpt-4o"
+        # Детерминированные ответы: воспроизводимость и стабильный префикс для кеша промптов
+        self.temperature = 0.0
+        self.seed = 42
         self.max_iterations = 50
         self.current_iteration = 0
-        self.max_context_messages = max_context_messages
-
-        # Загружаем системный промпт
-        system_prompt_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)), "prompts", "system_prompt.txt"
-        )
+        self.max_input_tokens = max_input_tokens
         try:
-            with open(system_prompt_path, "r", encoding="utf-8") as f:
-                self.system_prompt = f.read()
-        except FileNotFoundError:
-            self.system_prompt = (
-                "Ты — автономный AI-агент, управляющий веб-браузером."
-            )
+            self.encoder = tiktoken.encoding_for_model(self.model)
+        except Exception as e:
+            # Кодировка скачивается при первом запуске; без сети считаем токены приближенно
+            self.logger.warning("Кодировка tiktoken недоступна (%s), токены оцениваются по длине текста", e)
+            self.encoder = None
+        # Тексты сообщений не меняются, поэтому каждый кодируется один раз
+        self._count_text_tokens = functools.lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)(
+            self._encode_length
+        )
+        # Токены схем инструментов (считаются один раз при первой обрезке контекста)
+        self._tool_definitions_tokens: Optional[int] = None
+        # Последнее наблюдение за страницей: (номер итерации, сообщение)
+        self._last_observation: Optional[Tuple[int, Dict[str, Any]]] = None
+        # Кеш результатов: (инструмент, аргументы, URL) -> (время вызова, (результат, успех))
+        self._tool_cache: Dict[Tuple[str, str, str], Tuple[float, "asyncio.Future[Tuple[str, bool]]"]] = {}
+        self.system_prompt = _load_system_prompt()
 
     def _reset_and_start_new_task(self, user_prompt: str):
         """Очищает историю и начинает новую задачу."""
@@ -58,7 +102,239 @@ class AICore:
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": f"Цель: {user_prompt}"},
         ]
-        self.logger.info(f"Начало выполнения задачи: {user_prompt}")
+        self._last_observation = None
+        self._tool_cache.clear()
+        self.logger.info("Начало выполнения задачи: %s", user_prompt)
+
+    def _add_observation(self, observation: str) -> None:
+        """
+        Добавляет наблюдение за страницей в историю.
+
+        Предыдущее наблюдение заменяется короткой заглушкой: LLM нужно только текущее
+        состояние страницы, а результаты действий остаются в сообщениях инструментов.
+        """
+        # Сводка страницы заново расставляет data-ai-id, поэтому результаты инструментов,
+        # полученные по старым идентификаторам, больше не действительны
+        self._tool_cache.clear()
+
+        if self._last_observation:
+            iteration, message = self._last_observation
+            message["content"] = f"[Состояние страницы с итерации {iteration} — устарело]"
+
+        message = {"role": "user", "content": observation}
+        self.messages.append(message)
+        self._last_observation = (self.current_iteration, message)
+
+    def _encode_length(self, text: str) -> int:
+        """Возвращает количество токенов в тексте (или оценку, если кодировка недоступна)."""
+        if self.encoder is None:
+            return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return len(self.encoder.encode(text))
+
+    def _count_tokens(self, message: Dict[str, Any]) -> int:
+        """Подсчитывает количество токенов, которое сообщение занимает в запросе."""
+        tokens = TOKENS_PER_MESSAGE
+        if message.get("content"):
+            tokens += self._count_text_tokens(message["content"])
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call["function"]
+            tokens += self._count_text_tokens(function["name"])
+            tokens += self._count_text_tokens(function["arguments"])
+        return tokens
+
+    def _trim_context(self) -> None:
+        """
+        Обрезает историю сообщений под бюджет токенов.
+
+        Системный промпт и цель пользователя сохраняются всегда. Остальные сообщения
+        отбрасываются с начала истории целыми блоками: ответ ассистента удаляется вместе
+        с результатами его инструментов, чтобы не разрывать пары tool_calls → tool.
+        """
+        head, tail = self.messages[:2], self.messages[2:]
+        budget = int(self.max_input_tokens * (1 - CONTEXT_SAFETY_MARGIN))
+        budget -= sum(self._count_tokens(message) for message in head)
+        if self._tool_definitions_tokens is None:
+            # Схемы инструментов отправляются с каждым запросом и тоже занимают контекст
+            self._tool_definitions_tokens = self._encode_length(
+                json.dumps(self.tool_manager.get_tool_definitions(), ensure_ascii=False)
+            )
+        budget -= self._tool_definitions_tokens
+
+        blocks: List[List[Dict[str, Any]]] = []
+        for message in tail:
+            if message["role"] == "tool" and blocks:
+                blocks[-1].append(message)
+            else:
+                blocks.append([message])
+
+        kept: List[List[Dict[str, Any]]] = []
+        used = 0
+        for block in reversed(blocks):
+            block_tokens = sum(self._count_tokens(message) for message in block)
+            # Последний блок (текущее наблюдение) сохраняем в любом случае
+            if kept and used + block_tokens > budget:
+                break
+            kept.append(block)
+            used += block_tokens
+
+        if len(kept) < len(blocks):
+            self.messages = head + [message for block in reversed(kept) for message in block]
+            self.logger.info(
+                "Контекст обрезан: удалено блоков %d, осталось ~%d токенов истории",
+                len(blocks) - len(kept),
+                used,
+            )
+
+    async def _request_completion(self) -> Dict[str, Any]:
+        """
+        Запрашивает у LLM следующий шаг в потоковом режиме.
+
+        Сообщение ассистента собирается из фрагментов по мере их поступления: текст
+        склеивается, а имена и аргументы вызовов инструментов накапливаются по индексу
+        вызова. Чтение потока прекращается, как только модель сообщает о завершении.
+
+        Returns:
+            Сообщение ассистента в формате истории OpenAI.
+        """
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages,
+            tools=self.tool_manager.get_tool_definitions(),
+            tool_choice="auto",
+            temperature=self.temperature,
+            seed=self.seed,
+            stream=True,
+        )
+
+        content_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    content_parts.append(choice.delta.content)
+                for tool_call_delta in choice.delta.tool_calls or []:
+                    tool_call = tool_calls.setdefault(
+                        tool_call_delta.index,
+                        {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+                    )
+                    if tool_call_delta.id:
+                        tool_call["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                        tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+                if choice.finish_reason:
+                    break
+        finally:
+            await stream.close()
+
+        message: Dict[str, Any] = {"role": "assistant", "content": "".join(content_parts) or None}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+        return message
+
+    async def _execute_tool_call(
+        self, tool_call: Dict[str, Any], browser_controller: BrowserController
+    ) -> str:
+        """
+        Выполняет один вызов инструмента, запрошенный LLM.
+
+        Результаты кешируемых инструментов переиспользуются в течение TOOL_CACHE_TTL секунд
+        для тех же аргументов и URL, а одинаковые одновременные вызовы ждут один общий
+        результат. Инструменты, меняющие страницу, сбрасывают кеш.
+        """
+        function_name = tool_call["function"]["name"]
+        arguments = tool_call["function"]["arguments"]
+        try:
+            function_args = _json_loads(arguments)
+        except json.JSONDecodeError as e:
+            self.logger.error("Ошибка парсинга JSON: %s", arguments)
+            return f"Ошибка: невалидные аргументы JSON - {str(e)}"
+
+        if not self.tool_manager.is_cacheable(function_name):
+            result, _ = await self._call_tool(function_name, function_args)
+            if not self.tool_manager.is_parallel_safe(function_name):
+                self._tool_cache.clear()
+            return result
+
+        cache_key = (
+            function_name,
+            json.dumps(function_args, sort_keys=True),
+            browser_controller.page.url if browser_controller.page else "",
+        )
+        cached = self._tool_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < TOOL_CACHE_TTL:
+            self.logger.info("Результат инструмента %s взят из кеша", function_name)
+            result, _ = await cached[1]
+            return result
+
+        # Сохраняем еще выполняющийся вызов, чтобы одинаковые вызовы из того же ответа LLM ждали его
+        future = asyncio.ensure_future(self._call_tool(function_name, function_args))
+        if len(self._tool_cache) >= TOOL_CACHE_SIZE:
+            # Удаляем самую старую запись
+            self._tool_cache.pop(next(iter(self._tool_cache)))
+        self._tool_cache[cache_key] = (time.monotonic(), future)
+
+        result, succeeded = await future
+        if not succeeded:
+            # Ошибки не кешируем: повторный вызов может оказаться успешным
+            cached = self._tool_cache.get(cache_key)
+            if cached and cached[1] is future:
+                del self._tool_cache[cache_key]
+        return result
+
+    async def _call_tool(self, function_name: str, function_args: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Вызывает инструмент и превращает его исключение в текст ошибки для LLM.
+
+        Returns:
+            Результат инструмента и признак того, что вызов завершился без исключения.
+        """
+        self.logger.info("Выполнение инструмента: %s с аргументами: %s", function_name, function_args)
+        try:
+            return await self.tool_manager.call_tool(function_name, **function_args), True
+        except Exception as e:
+            # На каждый tool_call нужен ответ, иначе история сообщений станет некорректной
+            self.logger.error("Ошибка инструмента %s: %s", function_name, e)
+            # Состояние страницы после сбоя неизвестно
+            self._tool_cache.clear()
+            return f"Ошибка при выполнении инструмента '{function_name}': {str(e)}", False
+
+    async def _execute_tool_calls(
+        self, tool_calls: List[Dict[str, Any]], browser_controller: BrowserController
+    ) -> List[str]:
+        """
+        Выполняет вызовы инструментов и возвращает результаты в исходном порядке.
+
+        Идущие подряд инструменты, помеченные как parallel_safe, выполняются одновременно.
+        Остальные (навигация, клики, ввод) меняют страницу и выполняются строго по очереди.
+        """
+        results: List[str] = []
+        batch: List[Dict[str, Any]] = []
+        for tool_call in tool_calls:
+            if self.tool_manager.is_parallel_safe(tool_call["function"]["name"]):
+                batch.append(tool_call)
+                continue
+            if batch:
+                results.extend(await self._execute_batch(batch, browser_controller))
+                batch = []
+            results.append(await self._execute_tool_call(tool_call, browser_controller))
+
+        if batch:
+            results.extend(await self._execute_batch(batch, browser_controller))
+        return results
+
+    async def _execute_batch(
+        self, tool_calls: List[Dict[str, Any]], browser_controller: BrowserController
+    ) -> List[str]:
+        """Выполняет группу независимых вызовов инструментов одновременно."""
+        return list(
+            await asyncio.gather(
+                *(self._execute_tool_call(tool_call, browser_controller) for tool_call in tool_calls)
+            )
+        )
 
     async def run_agent_loop(
         self, user_prompt: str, browser_controller: BrowserController
@@ -66,12 +342,20 @@ class AICore:
         """
         Основной цикл работы агента.
         """
+        from openai import (
+            APIError,
+            AuthenticationError,
+            BadRequestError,
+            PermissionDeniedError,
+            RateLimitError,
+        )
+
         self.current_iteration = 0
         self._reset_and_start_new_task(user_prompt)
 
         while self.current_iteration < self.max_iterations:
             self.current_iteration += 1
-            self.logger.info(f"Итерация {self.current_iteration}")
+            self.logger.info("Итерация %d", self.current_iteration)
 
             try:
                 # 1. Наблюдение: получить текущее состояние страницы
@@ -79,7 +363,9 @@ class AICore:
                     self.logger.error("Страница браузера не инициализирована")
                     break
 
-                page_summary = await PageAnalyzer.get_page_summary(browser_controller.page)
+                page_summary = await PageAnalyzer.get_page_summary(
+                    browser_controller.page, skip_wait=browser_controller.dom_ready
+                )
                 observation = (
                     f"Текущая страница:\n"
                     f"URL: {page_summary['url']}\n"
@@ -87,48 +373,34 @@ class AICore:
                     f"Текстовая информация: {page_summary['text_preview'][:500]}...\n\n"
                     f"Интерактивные элементы на странице:\n{page_summary['simplified_dom']}"
                 )
-                self.messages.append({"role": "user", "content": observation})
+                self._add_observation(observation)
+                self._trim_context()
 
                 # 2. Мысль: отправить запрос к LLM
-                response = await self.client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=self.messages,
-                    tools=self.tool_manager.get_tool_definitions(),
-                    tool_choice="auto",
-                )
-                response_message = response.choices[0].message
+                response_message = await self._request_completion()
 
                 # Сохраняем ответ ассистента в историю СРАЗУ
-                self.messages.append(response_message.model_dump())
+                self.messages.append(response_message)
 
                 # 3. Действие: выполнить действие, выбранное LLM
-                if response_message.tool_calls:
-                    for tool_call in response_message.tool_calls:
-                        function_name = tool_call.function.name
-
-                        try:
-                            function_args = json.loads(tool_call.function.arguments)
-                            self.logger.info(f"Выполнение инструмента: {function_name} с аргументами: {function_args}")
-                            result = await self.tool_manager.call_tool(function_name, **function_args)
-                        except json.JSONDecodeError as e:
-                            self.logger.error(f"Ошибка парсинга JSON: {tool_call.function.arguments}")
-                            result = f"Ошибка: невалидные аргументы JSON - {str(e)}"
-
-                        self.logger.info(f"Результат выполнения: {result[:200]}...")
+                tool_calls = response_message.get("tool_calls")
+                if tool_calls:
+                    results = await self._execute_tool_calls(tool_calls, browser_controller)
+                    for tool_call, result in zip(tool_calls, results):
+                        self.logger.info("Результат выполнения: %.200s...", result)
 
                         # Добавляем результат работы инструмента в историю
                         self.messages.append(
                             {
                                 "role": "tool",
-                                "tool_call_id": tool_call.id,
-                                "name": function_name,
+                                "tool_call_id": tool_call["id"],
+                                "name": tool_call["function"]["name"],
                                 "content": result,
                             }
                         )
-                    await asyncio.sleep(1)  # Небольшая пауза
                 else:
-                    final_message = response_message.content or "Задача выполнена."
-                    self.logger.info(f"Агент завершил работу: {final_message}")
+                    final_message = response_message["content"] or "Задача выполнена."
+                    self.logger.info("Агент завершил работу: %s", final_message)
                     print(f"\n{'=' * 60}\nАгент завершил работу:\n{final_message}\n{'=' * 60}\n")
                     break
 
@@ -143,7 +415,7 @@ class AICore:
                 print(f"❌ {error_message}")
                 break
             except Exception as e:
-                self.logger.error(f"Ошибка в цикле агента: {str(e)}", exc_info=True)
+                self.logger.error("Ошибка в цикле агента: %s", e, exc_info=True)
                 print(f"⚠️ Ошибка: {str(e)}. Продолжаю...")
                 self.messages.append({"role": "user", "content": f"Произошла ошибка: {str(e)}"})
 
@@ -1,9 +1,294 @@
 """Модуль анализа и разметки DOM страницы."""
 
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
 import os
-from typing import Dict
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+# Встроенные скрипты на случай, если файлы из папки scripts недоступны
+_FALLBACK_ANALYZE_JS = """
+() => {
+    const MAX_ELEMENTS = 200;
+    const MAX_TEXT_LENGTH = 80;
+    const MAX_LABEL_SCAN = 200;
+
+    const root = document.body || document;
+
+    // Снимаем разметку предыдущего анализа, чтобы идентификаторы не дублировались
+    root.querySelectorAll('[data-ai-id]').forEach(el => el.removeAttribute('data-ai-id'));
+
+    const interactiveElements = root.querySelectorAll(
+        'a, button, input:not([type="hidden"]), textarea, select, [role="button"], [onclick], [tabindex="0"]'
+    );
+    const viewportHeight = window.innerHeight;
+
+    const candidates = Array.prototype.map.call(interactiveElements, el => {
+        // Дешевые проверки: скрытые поддеревья, отключенные элементы и элементы без боксов
+        if (el.offsetParent === null || el.disabled || el.hidden || el.getClientRects().length === 0) {
+            return null;
+        }
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) {
+            return null;
+        }
+        // Стили вычисляем только для элементов, прошедших все дешевые проверки
+        const style = window.getComputedStyle(el);
+        if (style.visibility === 'hidden' || style.opacity === '0') {
+            return null;
+        }
+        return { el, inViewport: rect.top >= 0 && rect.top < viewportHeight };
+    }).filter(Boolean);
+
+    candidates.sort((a, b) => Number(b.inViewport) - Number(a.inViewport));
+    const selected = candidates.slice(0, MAX_ELEMENTS);
+    const elements = new Array(selected.length);
+
+    selected.forEach(({ el }, i) => {
+        const newId = `ai-id-${i}`;
+        el.setAttribute('data-ai-id', newId);
+
+        // textContent не требует пересчета раскладки, в отличие от innerText
+        const label = el.textContent || el.value || el.getAttribute('aria-label') || el.title || el.placeholder || '';
+        // Сначала обрезаем, чтобы не нормализовать пробелы в длинных текстах
+        const text = label.substring(0, MAX_LABEL_SCAN).replace(/\\s+/g, ' ').trim().substring(0, MAX_TEXT_LENGTH);
 
-from playwright.async_api import Page
+        const tagName = el.tagName.toLowerCase();
+        const elementType = el.type || el.tagName.toLowerCase();
+
+        elements[i] = [tagName, newId, elementType, text];
+    });
+
+    return JSON.stringify(elements);
+}
+"""
+
+_FALLBACK_PAGE_TEXT_JS = """
+() => {
+    const MAX_TEXT_LENGTH = 2000;
+    if (!document.body) {
+        return '';
+    }
+
+    const candidates = [...document.querySelectorAll('main, article, [role="main"]'), document.body];
+    let bestText = '';
+    let bestScore = -1;
+    candidates.forEach(root => {
+        const text = root.innerText || '';
+        let linkLength = 0;
+        root.querySelectorAll('a').forEach(link => {
+            linkLength += (link.textContent || '').length;
+        });
+        const score = text.length / (1 + linkLength);
+        if (score > bestScore) {
+            bestScore = score;
+            bestText = text;
+        }
+    });
+
+    const seen = new Set();
+    const lines = [];
+    bestText.split('\\n').forEach(line => {
+        const normalized = line.replace(/\\s+/g, ' ').trim();
+        if (normalized && !seen.has(normalized)) {
+            seen.add(normalized);
+            lines.push(normalized);
+        }
+    });
+    return lines.join(' ').substring(0, MAX_TEXT_LENGTH);
+}
+"""
+
+# Размечает элементы, найденные в дереве доступности, сопоставляя их по роли и имени.
+# Принимает массив пар [role, name] в порядке обхода дерева.
+_TAG_ACCESSIBLE_NODES_JS = """
+(nodes) => {
+    const MAX_ELEMENTS = 200;
+    const MAX_TEXT_LENGTH = 80;
+    const ROLE_SELECTORS = {
+        link: 'a[href], [role="link"]',
+        button: 'button, input[type="button"], input[type="submit"], input[type="reset"], [role="button"]',
+        textbox: 'input:not([type]), input[type="text"], input[type="email"], input[type="password"], ' +
+                 'input[type="tel"], input[type="url"], input[type="number"], textarea, [role="textbox"], ' +
+                 '[contenteditable="true"]',
+        searchbox: 'input[type="search"], [role="searchbox"]',
+        combobox: 'select, input[list], [role="combobox"]',
+        checkbox: 'input[type="checkbox"], [role="checkbox"]',
+    };
+    const normalize = value => (value || '').replace(/\\s+/g, ' ').trim();
+    // Возможные варианты доступного имени элемента (упрощенно)
+    const candidateNames = el => [
+        el.getAttribute('aria-label'),
+        el.labels && el.labels.length ? el.labels[0].textContent : '',
+        el.textContent,
+        el.value,
+        el.placeholder,
+        el.title,
+        el.getAttribute('alt'),
+    ].map(normalize);
+    const namesCache = new Map();
+    const namesOf = el => {
+        if (!namesCache.has(el)) {
+            namesCache.set(el, candidateNames(el));
+        }
+        return namesCache.get(el);
+    };
+
+    document.querySelectorAll('[data-ai-id]').forEach(el => el.removeAttribute('data-ai-id'));
+
+    const candidatesByRole = {};
+    const taken = new Set();
+    const elements = [];
+
+    for (const [role, rawName] of nodes) {
+        if (elements.length >= MAX_ELEMENTS) {
+            break;
+        }
+        if (!candidatesByRole[role]) {
+            candidatesByRole[role] = Array.from(document.querySelectorAll(ROLE_SELECTORS[role]))
+                .filter(el => el.getClientRects().length > 0);
+        }
+        const name = normalize(rawName);
+        const el = candidatesByRole[role].find(candidate => {
+            if (taken.has(candidate)) {
+                return false;
+            }
+            const names = namesOf(candidate);
+            return name ? names.includes(name) : names.every(value => !value);
+        });
+        if (!el) {
+            continue;
+        }
+        taken.add(el);
+
+        const newId = `ai-id-${elements.length}`;
+        el.setAttribute('data-ai-id', newId);
+        const tagName = el.tagName.toLowerCase();
+        elements.push([tagName, newId, role, name.substring(0, MAX_TEXT_LENGTH)]);
+    }
+
+    return JSON.stringify(elements);
+}
+"""
+
+# Роли дерева доступности, которые агент может использовать как интерактивные элементы
+_ACCESSIBLE_ROLES = frozenset({"link", "button", "textbox", "searchbox", "combobox", "checkbox"})
+
+# Все данные страницы за один вызов: те же обход DOM и извлечение текста.
+# Принимает отпечаток прошлой сводки и возвращает null, если страница с тех пор не изменилась.
+_FALLBACK_PAGE_DATA_JS = f"""
+(previousFingerprint) => {{
+    // Документ, URL, версия DOM, прокрутка и размер окна (от них зависит разметка)
+    const fingerprint = typeof window.__aiDomVersion === 'number'
+        ? [performance.timeOrigin, location.href, window.__aiDomVersion,
+           window.scrollX, window.scrollY, window.innerWidth, window.innerHeight].join('|')
+        : null;
+    if (fingerprint !== null && fingerprint === previousFingerprint) {{
+        return null;
+    }}
+    return {{
+        fingerprint,
+        url: location.href,
+        title: document.title,
+        text_preview: ({_FALLBACK_PAGE_TEXT_JS})(),
+        simplified_dom: ({_FALLBACK_ANALYZE_JS})(),
+    }};
+}}
+"""
+
+# Счетчик изменений DOM для кеша сводок. Изменения data-ai-id вносит сам анализатор,
+# поэтому они не считаются; ввод в поля не порождает мутаций и учитывается отдельно.
+_DOM_VERSION_JS = """
+window.__aiDomVersion = 0;
+const bumpDomVersion = () => {
+    window.__aiDomVersion++;
+};
+new MutationObserver(mutations => {
+    if (mutations.some(m => m.type !== 'attributes' || m.attributeName !== 'data-ai-id')) {
+        bumpDomVersion();
+    }
+}).observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+document.addEventListener('input', bumpDomVersion, true);
+document.addEventListener('change', bumpDomVersion, true);
+"""
+
+# Время жизни закешированной сводки (секунды): страница может меняться и без мутаций DOM
+SUMMARY_CACHE_TTL = 5.0
+
+# Последняя сводка каждой страницы: страница -> (отпечаток, время, сводка)
+_summary_cache: weakref.WeakKeyDictionary[Page, Tuple[str, float, Dict[str, str]]] = (
+    weakref.WeakKeyDictionary()
+)
+
+# Глобальные функции страницы, устанавливаемые через add_init_script:
+# имя функции -> (файл скрипта, встроенный скрипт на случай отсутствия файла)
+_PAGE_GLOBALS = {
+    "__aiAnalyze": ("analyze_page.js", _FALLBACK_ANALYZE_JS),
+    "__aiGetText": ("get_page_text.js", _FALLBACK_PAGE_TEXT_JS),
+    "__aiGetData": ("get_page_data.js", _FALLBACK_PAGE_DATA_JS),
+}
+
+
+@functools.lru_cache(maxsize=16)
+def _read_js_script(filename: str) -> str:
+    """
+    Читает JavaScript скрипт из папки scripts.
+
+    Файлы не меняются во время работы, поэтому результат кешируется
+    (в том числе пустая строка для отсутствующего файла).
+    """
+    script_path = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "scripts", filename
+    )
+    try:
+        with open(script_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+@functools.lru_cache(maxsize=1)
+def _build_init_script() -> str:
+    """Собирает скрипт, объявляющий все функции анализа как глобальные функции окна."""
+    assignments = [_DOM_VERSION_JS.strip()]
+    for global_name, (filename, fallback) in _PAGE_GLOBALS.items():
+        js_script = _read_js_script(filename) or fallback
+        if js_script:
+            assignments.append(f"window.{global_name} = ({js_script});")
+    return "(() => {\n" + "\n".join(assignments) + "\n})();"
+
+
+# Результат вызова, если глобальная функция не установлена в документе
+# (null не подходит: его возвращает __aiGetData для неизменившейся страницы)
+_GLOBAL_MISSING = "__aiGlobalMissing__"
+
+
+def _global_call_expression(global_name: str) -> str:
+    """Возвращает функцию для page.evaluate, вызывающую установленную глобальную функцию."""
+    return (
+        f"(arg) => typeof window.{global_name} === 'function' "
+        f"? window.{global_name}(arg) : '{_GLOBAL_MISSING}'"
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _install_and_call_expression(global_name: str) -> str:
+    """
+    Возвращает функцию, устанавливающую глобальные функции в текущий документ
+    и вызывающую указанную функцию.
+    """
+    return f"(arg) => {{\n{_build_init_script()}\nreturn window.{global_name}(arg);\n}}"
+
+
+# Прогреваем кеш скриптов при импорте, чтобы первое действие агента не ждало чтения с диска
+_build_init_script()
 
 
 class PageAnalyzer:
@@ -14,113 +299,198 @@ class PageAnalyzer:
         """
         Загружает JavaScript скрипт из файла.
         """
-        script_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)), "scripts", filename
+        return _read_js_script(filename)
+
+    @staticmethod
+    def get_init_script() -> str:
+        """
+        Возвращает скрипт для page.add_init_script.
+
+        Скрипт объявляет функции анализа страницы глобально, чтобы при каждом анализе
+        передавать в браузер только короткий вызов, а не весь исходный код.
+        """
+        return _build_init_script()
+
+    @staticmethod
+    async def _wait_for_dom(page: Page, strict_wait: bool = False, skip_wait: bool = False) -> None:
+        """
+        Ожидает готовности DOM перед анализом страницы.
+
+        Args:
+            page: Страница Playwright.
+            strict_wait: Дождаться полного простоя сети вместо DOMContentLoaded.
+            skip_wait: DOM уже готов (например, по BrowserController.dom_ready), ожидание не нужно.
+        """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+        if skip_wait and not strict_wait:
+            return
+        if strict_wait:
+            await page.wait_for_load_state("networkidle", timeout=30000)
+            return
+        try:
+            await page.wait_for_load_state("domcontentloaded", timeout=3000)
+        except PlaywrightTimeoutError:
+            # Анализируем то, что уже успело загрузиться
+            pass
+
+    @staticmethod
+    async def _evaluate_script(page: Page, global_name: str, arg: Any = None) -> Any:
+        """
+        Выполняет скрипт анализа на странице.
+
+        Вызывает функцию, установленную через init script. Если ее нет (например,
+        документ создан до установки init script), устанавливает функции в текущий
+        документ, чтобы исходный код передавался в браузер один раз, а не при каждом анализе.
+        """
+        result = await page.evaluate(_global_call_expression(global_name), arg)
+        if result == _GLOBAL_MISSING:
+            result = await page.evaluate(_install_and_call_expression(global_name), arg)
+        return result
+
+    @staticmethod
+    def _format_elements(elements_json: str) -> str:
+        """
+        Форматирует элементы, найденные скриптом разметки, в упрощенный DOM для LLM.
+
+        Скрипты возвращают один JSON-массив [tag, ai_id, type, text] вместо множества
+        строк, собранных в браузере; строки для LLM собираются здесь.
+
+        Args:
+            elements_json: JSON-массив элементов.
+
+        Returns:
+            По одной строке вида <tag data-ai-id="..." type="...">text</tag> на элемент.
+        """
+        if not elements_json:
+            return ""
+        return "\n".join(
+            f'<{tag} data-ai-id="{ai_id}" type="{element_type}">{text}</{tag}>'
+            for tag, ai_id, element_type, text in json.loads(elements_json)
         )
+
+    @staticmethod
+    def _collect_accessible_nodes(node: Dict[str, Any], result: List[Tuple[str, str]]) -> None:
+        """Рекурсивно собирает интерактивные узлы дерева доступности в порядке обхода."""
+        if node.get("role") in _ACCESSIBLE_ROLES and not node.get("disabled"):
+            result.append((node["role"], node.get("name", "")))
+        for child in node.get("children", []):
+            PageAnalyzer._collect_accessible_nodes(child, result)
+
+    @staticmethod
+    async def get_accessibility_snapshot(page: Page) -> str:
+        """
+        Строит упрощенный DOM по дереву доступности браузера.
+
+        Используется как запасной путь, когда обход DOM не нашел интерактивных элементов.
+        Найденные узлы размечаются data-ai-id отдельным вызовом, сопоставляющим их
+        с DOM по роли и имени.
+
+        Returns:
+            Упрощенный DOM или пустая строка, если дерево доступности непригодно.
+        """
         try:
-            with open(script_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
+            snapshot = await page.accessibility.snapshot(interesting_only=True)
+        except Exception:
+            return ""
+        if not snapshot:
+            return ""
+
+        nodes: List[Tuple[str, str]] = []
+        PageAnalyzer._collect_accessible_nodes(snapshot, nodes)
+        if not nodes:
             return ""
 
+        return PageAnalyzer._format_elements(await page.evaluate(_TAG_ACCESSIBLE_NODES_JS, nodes))
+
     @staticmethod
-    async def get_simplified_dom(page: Page) -> str:
+    async def get_simplified_dom(page: Page, strict_wait: bool = False, skip_wait: bool = False) -> str:
         """
         Возвращает упрощенную и размеченную версию DOM.
         """
-        # === ИЗМЕНЕНИЕ ЗДЕСЬ ===
-        await page.wait_for_load_state("domcontentloaded", timeout=30000)
-
-        js_script = PageAnalyzer._load_js_script("analyze_page.js")
-        if not js_script:
-            js_script = """
-            () => {
-                let idCounter = 0;
-                const interactiveElements = document.querySelectorAll(
-                    'a, button, input:not([type="hidden"]), textarea, select, [role="button"], [onclick], [tabindex="0"]'
-                );
-                const simplified_elements = [];
-
-                interactiveElements.forEach(el => {
-                    const style = window.getComputedStyle(el);
-                    if (style.display !== 'none' &&
-                        style.visibility !== 'hidden' &&
-                        style.opacity !== '0' &&
-                        !el.disabled &&
-                        el.offsetParent !== null) {
-
-                        const rect = el.getBoundingClientRect();
-                        if (rect.width > 0 && rect.height > 0) {
-                            const newId = `ai-id-${idCounter++}`;
-                            el.setAttribute('data-ai-id', newId);
-
-                            let text = el.innerText || el.textContent || el.value || el.placeholder || el.getAttribute('aria-label') || el.title || '';
-                            text = text.trim().substring(0, 150);
-
-                            const tagName = el.tagName.toLowerCase();
-                            const elementType = el.type || el.tagName.toLowerCase();
-
-                            simplified_elements.push(
-                                `<${tagName} data-ai-id="${newId}" type="${elementType}">${text}</${tagName}>`
-                            );
-                        }
-                    }
-                });
-
-                return simplified_elements.join('\\n');
-            }
-            """
+        await PageAnalyzer._wait_for_dom(page, strict_wait, skip_wait)
+
+        # Разметка data-ai-id будет перестроена, закешированная сводка станет неверной
+        _summary_cache.pop(page, None)
 
-        simplified_dom = await page.evaluate(f"({js_script})()")
+        elements_json = await PageAnalyzer._evaluate_script(page, "__aiAnalyze")
+        simplified_dom = PageAnalyzer._format_elements(elements_json)
+        if not simplified_dom:
+            # Обход DOM ничего не нашел - пробуем дерево доступности
+            simplified_dom = await PageAnalyzer.get_accessibility_snapshot(page)
         return simplified_dom or "На странице нет интерактивных элементов."
 
     @staticmethod
-    async def get_page_text_content(page: Page) -> str:
+    async def get_page_text_content(page: Page, strict_wait: bool = False, skip_wait: bool = False) -> str:
         """
         Извлекает текстовое содержимое страницы.
         """
-        # === ИЗМЕНЕНИЕ ЗДЕСЬ ===
-        await page.wait_for_load_state("domcontentloaded", timeout=30000)
-
-        js_script = PageAnalyzer._load_js_script("get_page_text.js")
-        if not js_script:
-            js_script = """
-            () => {
-                const scripts = document.querySelectorAll('script, style, noscript');
-                scripts.forEach(el => el.remove());
-                const bodyText = document.body.innerText || document.body.textContent || '';
-                return bodyText.trim().substring(0, 2000);
-            }
-            """
+        await PageAnalyzer._wait_for_dom(page, strict_wait, skip_wait)
 
-        text_content = await page.evaluate(f"({js_script})()")
+        text_content = await PageAnalyzer._evaluate_script(page, "__aiGetText")
         return text_content or ""
 
     @staticmethod
-    async def get_page_summary(page: Page) -> Dict[str, str]:
+    async def get_page_summary(
+        page: Page, strict_wait: bool = False, skip_wait: bool = False
+    ) -> Dict[str, str]:
         """
         Получает краткую сводку о странице.
+
+        Если с прошлого вызова документ, URL, DOM, прокрутка и размер окна не изменились
+        и прошло меньше SUMMARY_CACHE_TTL секунд, возвращает закешированную сводку.
         """
-        await page.wait_for_load_state("domcontentloaded", timeout=30000)
+        await PageAnalyzer._wait_for_dom(page, strict_wait, skip_wait)
 
-        js_script = PageAnalyzer._load_js_script("get_page_data.js")
-        if not js_script:
-            # Fallback: делаем два отдельных вызова
-            summary = {
-                "url": page.url,
-                "title": await page.title(),
-                "text_preview": await PageAnalyzer.get_page_text_content(page),
-                "simplified_dom": await PageAnalyzer.get_simplified_dom(page),  # Добавим и DOM для консистентности
-            }
-            return summary
+        cached = _summary_cache.get(page)
+        if cached is not None and time.monotonic() - cached[1] >= SUMMARY_CACHE_TTL:
+            cached = None
 
-        page_data = await page.evaluate(f"({js_script})()")
+        # Проверка отпечатка, URL, заголовок, текст и DOM - одним вызовом;
+        # null означает, что страница не изменилась с закешированной сводки
+        page_data = await PageAnalyzer._evaluate_script(
+            page, "__aiGetData", cached[0] if cached is not None else None
+        )
+        if page_data is None and cached is not None:
+            return dict(cached[2])
+        page_data = page_data or {}
+
+        elements_json = page_data.get("simplified_dom")
+        simplified_dom = PageAnalyzer._format_elements(elements_json) if elements_json is not None else ""
+        if not simplified_dom:
+            # Обход DOM ничего не нашел - пробуем дерево доступности (лишние вызовы только в этом случае)
+            simplified_dom = await PageAnalyzer.get_accessibility_snapshot(page)
+        if not simplified_dom:
+            simplified_dom = (
+                "Не удалось проанализировать DOM."
+                if elements_json is None
+                else "На странице нет интерактивных элементов."
+            )
 
         summary = {
-            "url": page.url,
-            "title": await page.title(),
+            "url": page_data.get("url") or page.url,
+            "title": page_data.get("title", ""),
             "text_preview": page_data.get("text_preview", ""),
-            "simplified_dom": page_data.get("simplified_dom", "Не удалось проанализировать DOM."),
+            "simplified_dom": simplified_dom,
         }
 
+        fingerprint = page_data.get("fingerprint")
+        if fingerprint:
+            _summary_cache[page] = (fingerprint, time.monotonic(), summary)
+        else:
+            _summary_cache.pop(page, None)
+
         return summary
+
+    @staticmethod
+    async def get_page_summary_batch(pages: List[Page]) -> List[Dict[str, str]]:
+        """
+        Получает сводки нескольких страниц одновременно.
+
+        Args:
+            pages: Список страниц Playwright.
+
+        Returns:
+            Сводки страниц в том же порядке.
+        """
+        return list(await asyncio.gather(*(PageAnalyzer.get_page_summary(page) for page in pages)))
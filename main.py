@@ -11,6 +11,7 @@ from agent.core import AICore
 from tools.browser_tools import BrowserTools
 from tools.tool_manager import ToolManager
 from utils.logger import setup_logger
+from utils.playwright_patch import disable_playwright_stack_capture
 
 
 async def main() -> None:
@@ -32,8 +33,15 @@ async def main() -> None:
         )
         sys.exit(1)
 
+    # Убираем накладные расходы Playwright на сбор стека при каждом вызове API
+    if disable_playwright_stack_capture():
+        logger.info("Сбор стека вызовов Playwright отключен (AGENT_DISABLE_PW_STACK=0 для отладки)")
+
     # Инициализация компонентов
-    browser_controller = BrowserController(headless=False)
+    browser_controller = BrowserController(
+        headless=False,
+        block_resources=os.getenv("AGENT_BLOCK_RESOURCES", "1") != "0",
+    )
     logger.info("Запуск браузера...")
 
     try:
@@ -41,12 +49,12 @@ async def main() -> None:
         logger.info("Браузер успешно запущен")
 
         # Создание инструментов и автоматическая регистрация
-        browser_tools = BrowserTools(browser_controller.page)
+        browser_tools = BrowserTools(browser_controller.page, browser_controller)
         tool_manager = ToolManager()
 
-        # Автоматическая регистрация всех публичных async методов из BrowserTools
+        # Регистрация методов BrowserTools, помеченных декоратором @tool
         tool_manager.register_tools_from_instance(browser_tools)
-        logger.info(f"Зарегистрировано инструментов: {len(tool_manager.tools)}")
+        logger.info("Зарегистрировано инструментов: %d", len(tool_manager.tools))
 
         # Создание AI-агента
         agent = AICore(api_key=api_key, tool_manager=tool_manager)
@@ -70,7 +78,7 @@ async def main() -> None:
                 break
 
             try:
-                logger.info(f"Запуск агента с задачей: {user_task}")
+                logger.info("Запуск агента с задачей: %s", user_task)
                 await agent.run_agent_loop(user_task, browser_controller)
                 print("\n" + "-" * 60)
                 print("Задача завершена. Можете ввести новую задачу или 'exit' для выхода.")
@@ -80,12 +88,12 @@ async def main() -> None:
                 print("\n\n⚠️  Работа прервана пользователем.")
                 break
             except Exception as e:
-                logger.error(f"Критическая ошибка: {str(e)}", exc_info=True)
+                logger.error("Критическая ошибка: %s", e, exc_info=True)
                 print(f"\n❌ Произошла критическая ошибка: {str(e)}")
                 print("Попробуйте еще раз или введите 'exit' для выхода.\n")
 
     except Exception as e:
-        logger.error(f"Ошибка при запуске: {str(e)}", exc_info=True)
+        logger.error("Ошибка при запуске: %s", e, exc_info=True)
         print(f"❌ Ошибка при запуске: {str(e)}")
     finally:
         logger.info("Закрытие браузера...")
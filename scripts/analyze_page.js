@@ -1,46 +1,61 @@
 /**
  * JavaScript скрипт для анализа и разметки интерактивных элементов страницы.
- * Присваивает каждому видимому интерактивному элементу уникальный data-ai-id.
+ * Присваивает видимым интерактивным элементам уникальный data-ai-id.
+ * Возвращает не более MAX_ELEMENTS элементов: сначала те, что в области видимости.
  * 
- * @returns {string} Упрощенное текстовое представление интерактивных элементов
+ * @returns {string} JSON-массив элементов вида [tag, data-ai-id, type, text]
  */
 () => {
-    let idCounter = 0;
-    const interactiveElements = document.querySelectorAll(
+    const MAX_ELEMENTS = 200;
+    const MAX_TEXT_LENGTH = 80;
+    const MAX_LABEL_SCAN = 200;
+
+    const root = document.body || document;
+
+    // Снимаем разметку предыдущего анализа, чтобы идентификаторы не дублировались
+    root.querySelectorAll('[data-ai-id]').forEach(el => el.removeAttribute('data-ai-id'));
+
+    const interactiveElements = root.querySelectorAll(
         'a, button, input:not([type="hidden"]), textarea, select, [role="button"], [onclick], [tabindex="0"]'
     );
-    const simplified_elements = [];
+    const viewportHeight = window.innerHeight;
 
-    interactiveElements.forEach(el => {
-        // Проверяем, что элемент видим и активен
+    const candidates = Array.prototype.map.call(interactiveElements, el => {
+        // Дешевые проверки: скрытые поддеревья, отключенные элементы и элементы без боксов
+        if (el.offsetParent === null || el.disabled || el.hidden || el.getClientRects().length === 0) {
+            return null;
+        }
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) {
+            return null;
+        }
+        // Стили вычисляем только для элементов, прошедших все дешевые проверки
         const style = window.getComputedStyle(el);
-        if (style.display !== 'none' && 
-            style.visibility !== 'hidden' && 
-            style.opacity !== '0' &&
-            !el.disabled &&
-            el.offsetParent !== null) {
-            
-            const rect = el.getBoundingClientRect();
-            // Проверяем, что элемент имеет размеры
-            if (rect.width > 0 && rect.height > 0) {
-                const newId = `ai-id-${idCounter++}`;
-                el.setAttribute('data-ai-id', newId);
-                
-                // Извлекаем текст элемента
-                let text = el.innerText || el.textContent || el.value || el.placeholder || el.getAttribute('aria-label') || el.title || '';
-                text = text.trim().substring(0, 150);
-                
-                const tagName = el.tagName.toLowerCase();
-                const elementType = el.type || el.tagName.toLowerCase();
-                
-                simplified_elements.push(
-                    `<${tagName} data-ai-id="${newId}" type="${elementType}">${text}</${tagName}>`
-                );
-            }
+        if (style.visibility === 'hidden' || style.opacity === '0') {
+            return null;
         }
+        return { el, inViewport: rect.top >= 0 && rect.top < viewportHeight };
+    }).filter(Boolean);
+
+    candidates.sort((a, b) => Number(b.inViewport) - Number(a.inViewport));
+    const selected = candidates.slice(0, MAX_ELEMENTS);
+    const elements = new Array(selected.length);
+
+    selected.forEach(({ el }, i) => {
+        const newId = `ai-id-${i}`;
+        el.setAttribute('data-ai-id', newId);
+        
+        // textContent не требует пересчета раскладки, в отличие от innerText
+        const label = el.textContent || el.value || el.getAttribute('aria-label') || el.title || el.placeholder || '';
+        // Сначала обрезаем, чтобы не нормализовать пробелы в длинных текстах
+        const text = label.substring(0, MAX_LABEL_SCAN).replace(/\s+/g, ' ').trim().substring(0, MAX_TEXT_LENGTH);
+        
+        const tagName = el.tagName.toLowerCase();
+        const elementType = el.type || el.tagName.toLowerCase();
+        
+        elements[i] = [tagName, newId, elementType, text];
     });
     
-    return simplified_elements.join('\n') || "На странице нет интерактивных элементов.";
+    return JSON.stringify(elements);
 }
 
-
@@ -2,56 +2,115 @@
  * JavaScript скрипт для получения полной информации о странице за один вызов.
  * Оптимизированная версия, объединяющая разметку элементов и извлечение текста.
  * 
- * @returns {Object} Объект с simplified_dom и text_preview
+ * @param {?string} previousFingerprint Отпечаток страницы на момент прошлой сводки
+ * @returns {?Object} null, если страница не изменилась, иначе объект с fingerprint, url, title,
+ *     simplified_dom (JSON-массив элементов) и text_preview
  */
-() => {
-    // Функция для извлечения текста страницы
+(previousFingerprint) => {
+    // Документ, URL, версия DOM, прокрутка и размер окна (от них зависит разметка)
+    const fingerprint = typeof window.__aiDomVersion === 'number'
+        ? [performance.timeOrigin, location.href, window.__aiDomVersion,
+           window.scrollX, window.scrollY, window.innerWidth, window.innerHeight].join('|')
+        : null;
+    if (fingerprint !== null && fingerprint === previousFingerprint) {
+        return null;
+    }
+
+    // Функция для извлечения основного текста страницы без повторов
     const getPageTextContent = () => {
-        const scripts = document.querySelectorAll('script, style, noscript');
-        scripts.forEach(el => el.remove());
-        const bodyText = document.body.innerText || document.body.textContent || '';
-        return bodyText.trim().substring(0, 2000);
+        const MAX_TEXT_LENGTH = 2000;
+        if (!document.body) {
+            return '';
+        }
+
+        const candidates = [...document.querySelectorAll('main, article, [role="main"]'), document.body];
+        let bestText = '';
+        let bestScore = -1;
+        candidates.forEach(root => {
+            const text = root.innerText || '';
+            let linkLength = 0;
+            root.querySelectorAll('a').forEach(link => {
+                linkLength += (link.textContent || '').length;
+            });
+            const score = text.length / (1 + linkLength);
+            if (score > bestScore) {
+                bestScore = score;
+                bestText = text;
+            }
+        });
+
+        const seen = new Set();
+        const lines = [];
+        bestText.split('\n').forEach(line => {
+            const normalized = line.replace(/\s+/g, ' ').trim();
+            if (normalized && !seen.has(normalized)) {
+                seen.add(normalized);
+                lines.push(normalized);
+            }
+        });
+        return lines.join(' ').substring(0, MAX_TEXT_LENGTH);
     };
 
-    // Функция для разметки интерактивных элементов
+    // Функция для разметки интерактивных элементов (не более MAX_ELEMENTS, сначала видимые)
     const getSimplifiedDom = () => {
-        let idCounter = 0;
-        const interactiveElements = document.querySelectorAll(
+        const MAX_ELEMENTS = 200;
+        const MAX_TEXT_LENGTH = 80;
+        const MAX_LABEL_SCAN = 200;
+
+        const root = document.body || document;
+
+        // Снимаем разметку предыдущего анализа, чтобы идентификаторы не дублировались
+        root.querySelectorAll('[data-ai-id]').forEach(el => el.removeAttribute('data-ai-id'));
+
+        const interactiveElements = root.querySelectorAll(
             'a, button, input:not([type="hidden"]), textarea, select, [role="button"], [onclick], [tabindex="0"]'
         );
-        const simplified_elements = [];
+        const viewportHeight = window.innerHeight;
 
-        interactiveElements.forEach(el => {
+        const candidates = Array.prototype.map.call(interactiveElements, el => {
+            // Дешевые проверки: скрытые поддеревья, отключенные элементы и элементы без боксов
+            if (el.offsetParent === null || el.disabled || el.hidden || el.getClientRects().length === 0) {
+                return null;
+            }
+            const rect = el.getBoundingClientRect();
+            if (rect.width <= 0 || rect.height <= 0) {
+                return null;
+            }
+            // Стили вычисляем только для элементов, прошедших все дешевые проверки
             const style = window.getComputedStyle(el);
-            if (style.display !== 'none' &&
-                style.visibility !== 'hidden' &&
-                style.opacity !== '0' &&
-                !el.disabled &&
-                el.offsetParent !== null) {
-
-                const rect = el.getBoundingClientRect();
-                if (rect.width > 0 && rect.height > 0) {
-                    const newId = `ai-id-${idCounter++}`;
-                    el.setAttribute('data-ai-id', newId);
-
-                    let text = el.innerText || el.textContent || el.value || el.placeholder || el.getAttribute('aria-label') || el.title || '';
-                    text = text.trim().substring(0, 150);
-
-                    const tagName = el.tagName.toLowerCase();
-                    const elementType = el.type || el.tagName.toLowerCase();
-
-                    simplified_elements.push(
-                        `<${tagName} data-ai-id="${newId}" type="${elementType}">${text}</${tagName}>`
-                    );
-                }
+            if (style.visibility === 'hidden' || style.opacity === '0') {
+                return null;
             }
+            return { el, inViewport: rect.top >= 0 && rect.top < viewportHeight };
+        }).filter(Boolean);
+
+        candidates.sort((a, b) => Number(b.inViewport) - Number(a.inViewport));
+        const selected = candidates.slice(0, MAX_ELEMENTS);
+        const elements = new Array(selected.length);
+
+        selected.forEach(({ el }, i) => {
+            const newId = `ai-id-${i}`;
+            el.setAttribute('data-ai-id', newId);
+
+            // textContent не требует пересчета раскладки, в отличие от innerText
+            const label = el.textContent || el.value || el.getAttribute('aria-label') || el.title || el.placeholder || '';
+            // Сначала обрезаем, чтобы не нормализовать пробелы в длинных текстах
+            const text = label.substring(0, MAX_LABEL_SCAN).replace(/\s+/g, ' ').trim().substring(0, MAX_TEXT_LENGTH);
+
+            const tagName = el.tagName.toLowerCase();
+            const elementType = el.type || el.tagName.toLowerCase();
+
+            elements[i] = [tagName, newId, elementType, text];
         });
 
-        return simplified_elements.join('\n') || "На странице нет интерактивных элементов.";
+        return JSON.stringify(elements);
     };
 
-    // Возвращаем объект с результатами обеих функций
+    // Возвращаем все данные страницы за один вызов
     return {
+        fingerprint,
+        url: location.href,
+        title: document.title,
         simplified_dom: getSimplifiedDom(),
         text_preview: getPageTextContent()
     };
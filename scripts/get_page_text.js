@@ -1,17 +1,43 @@
 /**
  * JavaScript скрипт для извлечения текстового содержимого страницы.
- * Удаляет скрипты и стили, возвращает только видимый текст.
+ * Выбирает блок с основным содержимым (больше текста, меньше ссылок)
+ * и убирает повторяющиеся строки вроде пунктов меню и баннеров.
  * 
  * @returns {string} Текстовое содержимое страницы (до 2000 символов)
  */
 () => {
-    // Удаляем скрипты и стили
-    const scripts = document.querySelectorAll('script, style, noscript');
-    scripts.forEach(el => el.remove());
-    
-    // Получаем видимый текст
-    const bodyText = document.body.innerText || document.body.textContent || '';
-    return bodyText.trim().substring(0, 2000);
-}
+    const MAX_TEXT_LENGTH = 2000;
+    if (!document.body) {
+        return '';
+    }
+
+    // Оцениваем кандидатов: длина текста относительно длины текста ссылок
+    const candidates = [...document.querySelectorAll('main, article, [role="main"]'), document.body];
+    let bestText = '';
+    let bestScore = -1;
+    candidates.forEach(root => {
+        const text = root.innerText || '';
+        let linkLength = 0;
+        root.querySelectorAll('a').forEach(link => {
+            linkLength += (link.textContent || '').length;
+        });
+        const score = text.length / (1 + linkLength);
+        if (score > bestScore) {
+            bestScore = score;
+            bestText = text;
+        }
+    });
 
+    // Убираем пустые и повторяющиеся строки
+    const seen = new Set();
+    const lines = [];
+    bestText.split('\n').forEach(line => {
+        const normalized = line.replace(/\s+/g, ' ').trim();
+        if (normalized && !seen.has(normalized)) {
+            seen.add(normalized);
+            lines.push(normalized);
+        }
+    });
+    return lines.join(' ').substring(0, MAX_TEXT_LENGTH);
+}
 
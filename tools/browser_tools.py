@@ -1,20 +1,121 @@
 """Инструменты для взаимодействия с браузером."""
 
-from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+from typing import TYPE_CHECKING, Dict, Optional
+
+from agent.browser_controller import BrowserController
+from agent.page_analyzer import PageAnalyzer
+from tools.tool_manager import cacheable, parallel_safe, tool
+
+# Playwright импортируется только при вызове инструментов, чтобы не замедлять старт CLI
+if TYPE_CHECKING:
+    from playwright.async_api import Locator, Page
+
+# CSS-селекторы кнопок закрытия всплывающих окон (проверяются в браузере за один вызов)
+CLOSE_SELECTORS = (
+    '[aria-label="Close"]',
+    '[aria-label="close"]',
+    'button[class*="close"]',
+    'div[class*="close"]',
+    '[id*="close"]',
+)
+
+# Тексты кнопок согласия/закрытия (без учета регистра, как :has-text в Playwright)
+CLOSE_BUTTON_TEXTS = (
+    "Accept",
+    "Accept all",
+    "Хорошо",
+    "Принять все",
+    "No, thanks",
+)
+
+# Кликает по первому видимому элементу: сначала по CSS-селекторам, затем по тексту кнопок.
+# Возвращает сработавший селектор или null.
+_CLICK_FIRST_VISIBLE_JS = """
+({ selectors, texts }) => {
+    const isVisible = el => {
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) {
+            return false;
+        }
+        const style = window.getComputedStyle(el);
+        return style.visibility !== 'hidden' && style.display !== 'none';
+    };
+
+    for (const selector of selectors) {
+        const el = document.querySelector(selector);
+        if (el && isVisible(el)) {
+            el.click();
+            return selector;
+        }
+    }
+
+    // Все кнопки собираем один раз и сравниваем их текст со списком
+    const buttons = Array.from(document.querySelectorAll('button'), button => ({
+        button,
+        text: (button.textContent || '').replace(/\\s+/g, ' ').trim().toLowerCase(),
+    }));
+    for (const text of texts) {
+        const needle = text.toLowerCase();
+        const match = buttons.find(item => item.text.includes(needle) && isVisible(item.button));
+        if (match) {
+            match.button.click();
+            return `button:has-text("${text}")`;
+        }
+    }
+    return null;
+}
+"""
+
+# Постоянные скрипты прокрутки: одинаковый текст не приходится заново разбирать в браузере
+_SCROLL_BY_JS = "(dy) => window.scrollBy(0, dy)"
+_SCROLL_TOP_JS = "() => window.scrollTo(0, 0)"
+_SCROLL_BOTTOM_JS = "() => window.scrollTo(0, document.body.scrollHeight)"
 
 
 class BrowserTools:
     """Набор инструментов для взаимодействия с браузером."""
 
-    def __init__(self, page: Page):
+    def __init__(self, page: "Page", browser_controller: Optional[BrowserController] = None):
         """
         Инициализирует инструменты браузера.
 
         Args:
             page: Объект страницы Playwright.
+            browser_controller: Контроллер браузера для работы с дополнительными страницами.
         """
         self.page = page
+        self.browser_controller = browser_controller
+        # Локаторы по ai_id для текущего URL; сбрасываются при переходе на другую страницу
+        self._locator_cache: Dict[str, "Locator"] = {}
+        self._locator_cache_url = ""
+
+    def _get_locator(self, ai_id: str) -> "Locator":
+        """
+        Возвращает локатор элемента с указанным data-ai-id.
+
+        Используется движок test id Playwright (атрибут data-ai-id настраивается
+        в BrowserController.start) без разбора CSS-селектора. Локатор не привязан
+        к конкретному узлу DOM и ищет элемент заново при каждом действии, поэтому
+        его можно переиспользовать, пока не сменился URL.
+
+        Args:
+            ai_id: Идентификатор элемента.
+
+        Returns:
+            Локатор первого элемента с этим идентификатором.
+        """
+        url = self.page.url
+        if url != self._locator_cache_url:
+            self._locator_cache.clear()
+            self._locator_cache_url = url
 
+        locator = self._locator_cache.get(ai_id)
+        if locator is None:
+            locator = self.page.get_by_test_id(ai_id).first
+            self._locator_cache[ai_id] = locator
+        return locator
+
+    @tool
     async def click_element(self, ai_id: str) -> str:
         """
         Кликает по элементу с указанным data-ai-id.
@@ -23,18 +124,20 @@ class BrowserTools:
         Args:
             ai_id: Идентификатор элемента (например, 'ai-id-5').
         """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
         if not ai_id or not isinstance(ai_id, str):
             return "Ошибка: невалидный идентификатор элемента."
 
         try:
-            selector = f"[data-ai-id='{ai_id}']"
-            await self.page.click(selector, timeout=10000)
+            await self._get_locator(ai_id).click(timeout=10000)
             return f"Успешно нажат элемент с идентификатором {ai_id}."
         except PlaywrightTimeoutError:
             return f"Ошибка: элемент {ai_id} не найден или недоступен для клика."
         except Exception as e:
             return f"Ошибка при клике на элемент {ai_id}: {str(e)}"
 
+    @tool
     async def type_text(self, ai_id: str, text: str) -> str:
         """
         Вводит текст в поле с указанным data-ai-id.
@@ -43,20 +146,22 @@ class BrowserTools:
             ai_id: Идентификатор элемента (например, 'ai-id-3').
             text: Текст для ввода.
         """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
         if not ai_id or not isinstance(ai_id, str):
             return "Ошибка: невалидный идентификатор элемента."
         if not isinstance(text, str):
             return "Ошибка: текст должен быть строкой."
 
         try:
-            selector = f"[data-ai-id='{ai_id}']"
-            await self.page.fill(selector, text, timeout=10000)
+            await self._get_locator(ai_id).fill(text, timeout=10000)
             return f"Текст '{text}' успешно введен в элемент {ai_id}."
         except PlaywrightTimeoutError:
             return f"Ошибка: элемент {ai_id} не найден или недоступен для ввода."
         except Exception as e:
             return f"Ошибка при вводе текста в элемент {ai_id}: {str(e)}"
 
+    @tool
     async def navigate_to_url(self, url: str) -> str:
         """
         Переходит на указанный URL.
@@ -75,6 +180,7 @@ class BrowserTools:
         except Exception as e:
             return f"Ошибка при переходе на {url}: {str(e)}"
 
+    @tool
     async def scroll_page(self, direction: str = "down", pixels: int = 500) -> str:
         """
         Прокручивает страницу в указанном направлении.
@@ -91,20 +197,24 @@ class BrowserTools:
             return "Ошибка: количество пикселей должно быть неотрицательным целым числом."
 
         try:
+            # Прокручиваем окно, а не элемент под курсором (как сделал бы mouse.wheel)
             if direction == "down":
-                await self.page.evaluate(f"window.scrollBy(0, {pixels})")
+                await self.page.evaluate(_SCROLL_BY_JS, pixels)
             elif direction == "up":
-                await self.page.evaluate(f"window.scrollBy(0, -{pixels})")
+                await self.page.evaluate(_SCROLL_BY_JS, -pixels)
             elif direction == "top":
-                await self.page.evaluate("window.scrollTo(0, 0)")
+                await self.page.evaluate(_SCROLL_TOP_JS)
             elif direction == "bottom":
-                await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                await self.page.evaluate(_SCROLL_BOTTOM_JS)
 
             await self.page.wait_for_timeout(500)
             return f"Страница прокручена {direction}."
         except Exception as e:
             return f"Ошибка при прокрутке страницы: {str(e)}"
 
+    @tool
+    @cacheable
+    @parallel_safe
     async def get_element_text(self, ai_id: str) -> str:
         """
         Получает текст элемента с указанным data-ai-id.
@@ -112,15 +222,18 @@ class BrowserTools:
         Args:
             ai_id: Идентификатор элемента.
         """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
         try:
-            selector = f"[data-ai-id='{ai_id}']"
-            text = await self.page.text_content(selector, timeout=10000)
+            text = await self._get_locator(ai_id).text_content(timeout=10000)
             return text or f"Элемент {ai_id} не содержит текста."
         except PlaywrightTimeoutError:
             return f"Ошибка: элемент {ai_id} не найден."
         except Exception as e:
             return f"Ошибка при получении текста элемента {ai_id}: {str(e)}"
 
+    @tool
+    @parallel_safe
     async def wait_for_element(self, ai_id: str, timeout: int = 10000) -> str:
         """
         Ожидает появления элемента на странице.
@@ -129,15 +242,17 @@ class BrowserTools:
             ai_id: Идентификатор элемента.
             timeout: Таймаут ожидания в миллисекундах.
         """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
         try:
-            selector = f"[data-ai-id='{ai_id}']"
-            await self.page.wait_for_selector(selector, timeout=timeout)
+            await self._get_locator(ai_id).wait_for(timeout=timeout)
             return f"Элемент {ai_id} появился на странице."
         except PlaywrightTimeoutError:
             return f"Элемент {ai_id} не появился в течение {timeout}мс."
         except Exception as e:
             return f"Ошибка при ожидании элемента {ai_id}: {str(e)}"
 
+    @tool
     async def press_key(self, key: str) -> str:
         """
         Нажимает клавишу на странице.
@@ -146,11 +261,18 @@ class BrowserTools:
             key: Название клавиши (например, 'Enter', 'Escape', 'Tab').
         """
         try:
-            await self.page.keyboard.press(key)
+            # Нажатие через локатор дожидается начала навигации, которую оно вызвало
+            # (например, Enter в поле поиска), в отличие от page.keyboard.press
+            focused = self.page.locator(":focus")
+            if await focused.count():
+                await focused.first.press(key, timeout=10000)
+            else:
+                await self.page.keyboard.press(key)
             return f"Нажата клавиша {key}."
         except Exception as e:
             return f"Ошибка при нажатии клавиши {key}: {str(e)}"
 
+    @tool
     async def wait_for_navigation(self, timeout: int = 30000) -> str:
         """
         Ожидает завершения навигации на странице после действия (например, клика).
@@ -165,36 +287,66 @@ class BrowserTools:
         except Exception as e:
             return f"Ошибка при ожидании навигации: {str(e)}"
 
+    @tool
+    async def get_pages_overview(self, urls: str) -> str:
+        """
+        Открывает несколько страниц параллельно в фоне и возвращает краткую сводку по каждой.
+        Текущая страница при этом не меняется. Используй, когда нужно сравнить несколько сайтов или результатов.
+
+        Args:
+            urls: Список URL через пробел или с новой строки (например, 'example.com https://python.org').
+        """
+        # Не parallel_safe: инструмент открывает и закрывает вкладки в общем контексте браузера
+        # и в видимом браузере забирает фокус у основной страницы
+        if not self.browser_controller:
+            return "Ошибка: работа с несколькими страницами недоступна."
+        if not urls or not isinstance(urls, str):
+            return "Ошибка: невалидный список URL."
+
+        url_list = []
+        # Запятые допустимы внутри URL (например, '?ids=1,2'), поэтому делим только по пробелам;
+        # запятые-разделители по краям URL отбрасываются
+        for url in urls.split():
+            url = url.strip(",")
+            if url:
+                url_list.append(url if url.startswith(("http://", "https://")) else "https://" + url)
+        if not url_list:
+            return "Ошибка: не указан ни один URL."
+
+        pages = []
+        try:
+            pages = await self.browser_controller.open_pages(url_list)
+            summaries = await PageAnalyzer.get_page_summary_batch(pages)
+        except Exception as e:
+            return f"Ошибка при анализе страниц: {str(e)}"
+        finally:
+            # open_pages при ошибке сам закрывает открытые страницы
+            if pages:
+                await self.browser_controller.close_pages(pages)
+            # Возвращаем фокус основной странице агента
+            await self.page.bring_to_front()
+
+        return "\n\n".join(
+            f"URL: {summary['url']}\nЗаголовок: {summary['title']}\nТекст: {summary['text_preview'][:300]}"
+            for summary in summaries
+        )
+
+    @tool
     async def close_popup_if_present(self) -> str:
         """
         Проверяет наличие распространенных попап-окон (регистрация, cookie) и пытается их закрыть.
         Используй этот инструмент в начале работы на новой странице или если не можешь кликнуть по элементу.
         """
-        # Ищем кнопку закрытия по самым распространенным признакам
-        close_button_selectors = [
-            '[aria-label="Close"]',
-            '[aria-label="close"]',
-            'button[class*="close"]',
-            'div[class*="close"]',
-            '[id*="close"]',
-            'button:has-text("Accept")',
-            'button:has-text("Accept all")',
-            'button:has-text("Хорошо")',
-            'button:has-text("Принять все")',
-            'button:has-text("No, thanks")',
-        ]
-
-        for selector in close_button_selectors:
-            try:
-                # Используем locator, так как он не бросает ошибку, если элемент не найден сразу
-                close_button = self.page.locator(selector).first
-                # Проверяем, что элемент видим, прежде чем кликнуть
-                if await close_button.is_visible(timeout=1000):
-                    await close_button.click()
-                    await self.page.wait_for_timeout(500)  # Даем время на анимацию закрытия
-                    return f"Найдено и закрыто всплывающее окно с помощью селектора '{selector}'."
-            except Exception:
-                # Просто пробуем следующий селектор, если клик не удался или элемент не найден
-                continue
+        # Проверяем все селекторы и тексты кнопок одним вызовом в браузере
+        try:
+            selector = await self.page.evaluate(
+                _CLICK_FIRST_VISIBLE_JS,
+                {"selectors": list(CLOSE_SELECTORS), "texts": list(CLOSE_BUTTON_TEXTS)},
+            )
+        except Exception:
+            selector = None
+        if selector:
+            await self.page.wait_for_timeout(500)  # Даем время на анимацию закрытия
+            return f"Найдено и закрыто всплывающее окно с помощью селектора '{selector}'."
 
         return "Всплывающих окон для закрытия не найдено."
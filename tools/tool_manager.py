@@ -2,7 +2,11 @@
 
 import inspect
 import re
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Заголовок секции Args и строки параметров в ней ("param_name: описание")
+_ARGS_SPLIT_RE = re.compile(r"\n\s*Args:\s*\n")
+_ARG_RE = re.compile(r"^[ \t]*(\w+):[ \t]*(.*)$", re.MULTILINE)
 
 
 def parse_google_docstring(doc: str) -> Dict[str, Any]:
@@ -19,18 +23,12 @@ def parse_google_docstring(doc: str) -> Dict[str, Any]:
         return {"description": "", "params": {}}
 
     # Разделяем описание и секцию Args
-    parts = doc.split("Args:")
+    parts = _ARGS_SPLIT_RE.split(doc, maxsplit=1)
     description = parts[0].strip()
 
     params: Dict[str, str] = {}
     if len(parts) > 1:
-        arg_section = parts[1].strip()
-        # Парсим параметры в формате "param_name: описание"
-        for line in arg_section.split("\n"):
-            match = re.match(r"\s*(\w+):\s*(.*)", line)
-            if match:
-                param_name, param_desc = match.groups()
-                params[param_name] = param_desc.strip()
+        params = {match.group(1): match.group(2).strip() for match in _ARG_RE.finditer(parts[1])}
 
     return {"description": description, "params": params}
 
@@ -69,39 +67,195 @@ def python_type_to_json_type(python_type: type) -> str:
     return type_mapping.get(python_type, "string")
 
 
+def build_tool_schema(name: str, func: Callable) -> Dict[str, Any]:
+    """
+    Строит определение инструмента в формате OpenAI function calling.
+
+    Схема генерируется на основе сигнатуры функции и ее docstring.
+
+    Args:
+        name: Имя инструмента.
+        func: Функция-инструмент.
+
+    Returns:
+        Определение функции для OpenAI API.
+    """
+    sig = inspect.signature(func)
+    docstring_info = parse_google_docstring(func.__doc__ or "")
+
+    properties: Dict[str, Any] = {}
+    required: List[str] = []
+
+    # Обрабатываем параметры функции
+    for param_name, param in sig.parameters.items():
+        # Пропускаем служебные параметры
+        if param_name in ("self", "args", "kwargs"):
+            continue
+
+        # Определяем тип параметра
+        param_type = python_type_to_json_type(param.annotation) if param.annotation != inspect.Parameter.empty else "string"
+
+        # Специальная обработка для enum-подобных типов (например, direction в scroll_page)
+        param_schema: Dict[str, Any] = {
+            "type": param_type,
+            "description": docstring_info["params"].get(param_name, ""),
+        }
+
+        # Если параметр имеет значения по умолчанию, добавляем их
+        if param.default != inspect.Parameter.empty:
+            param_schema["default"] = param.default
+
+        properties[param_name] = param_schema
+
+        # Если параметр обязательный (нет значения по умолчанию)
+        if param.default == inspect.Parameter.empty:
+            required.append(param_name)
+
+    # Специальные случаи для некоторых инструментов
+    if name == "scroll_page" and "direction" in properties:
+        properties["direction"]["enum"] = ["down", "up", "top", "bottom"]
+
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": docstring_info["description"] or f"Выполняет действие: {name}",
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": required,
+            },
+        },
+    }
+
+
+def tool(func: Callable) -> Callable:
+    """
+    Помечает метод как инструмент агента и сразу строит его схему.
+
+    Схема строится один раз при импорте модуля, а не при каждой регистрации.
+
+    Args:
+        func: Async функция-инструмент.
+
+    Returns:
+        Та же функция с атрибутом __tool_schema__.
+    """
+    func.__tool_schema__ = build_tool_schema(func.__name__, func)
+    return func
+
+
+def parallel_safe(func: Callable) -> Callable:
+    """
+    Помечает инструмент как безопасный для параллельного выполнения.
+
+    Такие инструменты только читают состояние страницы, поэтому несколько их вызовов
+    из одного ответа LLM можно выполнять одновременно.
+
+    Args:
+        func: Функция-инструмент.
+
+    Returns:
+        Та же функция с установленной пометкой.
+    """
+    func.__parallel_safe__ = True
+    return func
+
+
+def cacheable(func: Callable) -> Callable:
+    """
+    Помечает инструмент как кешируемый.
+
+    Результат такого инструмента зависит только от аргументов и текущей страницы,
+    поэтому повторный вызов с теми же аргументами можно не выполнять.
+
+    Args:
+        func: Функция-инструмент.
+
+    Returns:
+        Та же функция с установленной пометкой.
+    """
+    func.__cacheable__ = True
+    return func
+
+
+class ToolRecord(NamedTuple):
+    """Зарегистрированный инструмент с готовой схемой."""
+
+    func: Callable
+    schema: Dict[str, Any]
+
+
 class ToolManager:
     """Менеджер для регистрации и вызова инструментов для AI-агента."""
 
     def __init__(self):
         """Инициализирует менеджер инструментов."""
-        self.tools: Dict[str, Callable] = {}
+        self.tools: Dict[str, ToolRecord] = {}
+        # Набор инструментов после регистрации не меняется, поэтому список схем собирается один раз
+        self._definitions_cache: Optional[List[Dict[str, Any]]] = None
 
-    def register_tool(self, name: str, func: Callable) -> None:
+    def register_tool(self, name: str, func: Callable, schema: Optional[Dict[str, Any]] = None) -> None:
         """
         Регистрирует инструмент для использования агентом.
 
         Args:
             name: Имя инструмента.
             func: Функция-инструмент (должна быть async).
+            schema: Готовая схема инструмента (по умолчанию строится из сигнатуры и docstring).
         """
         if not inspect.iscoroutinefunction(func):
             raise ValueError(f"Инструмент {name} должен быть async функцией")
-        self.tools[name] = func
+        if schema is None:
+            schema = build_tool_schema(name, func)
+        self.tools[name] = ToolRecord(func=func, schema=schema)
+        self._definitions_cache = None
 
     def register_tools_from_instance(self, instance: Any, prefix: str = "") -> None:
         """
-        Автоматически регистрирует все публичные async методы из экземпляра класса.
+        Регистрирует все методы экземпляра, помеченные декоратором tool.
 
         Args:
             instance: Экземпляр класса с методами-инструментами.
             prefix: Префикс для имен инструментов (необязательно).
         """
-        for name, method in inspect.getmembers(instance, predicate=inspect.ismethod):
-            if name.startswith("_") or not inspect.iscoroutinefunction(method):
+        # Смотрим только атрибуты класса, без обхода MRO и разрешения дескрипторов;
+        # сортировка сохраняет прежний (алфавитный) порядок инструментов в схемах
+        for name, attr in sorted(vars(type(instance)).items()):
+            schema = getattr(attr, "__tool_schema__", None)
+            if schema is None:
                 continue
 
             tool_name = f"{prefix}{name}" if prefix else name
-            self.register_tool(tool_name, method)
+            if tool_name != schema["function"]["name"]:
+                schema = {**schema, "function": {**schema["function"], "name": tool_name}}
+            self.register_tool(tool_name, getattr(instance, name), schema)
+
+    def is_parallel_safe(self, name: str) -> bool:
+        """
+        Проверяет, можно ли выполнять инструмент параллельно с другими.
+
+        Args:
+            name: Имя инструмента.
+
+        Returns:
+            True, если инструмент помечен декоратором parallel_safe.
+        """
+        record = self.tools.get(name)
+        return record is not None and bool(getattr(record.func, "__parallel_safe__", False))
+
+    def is_cacheable(self, name: str) -> bool:
+        """
+        Проверяет, можно ли кешировать результат инструмента.
+
+        Args:
+            name: Имя инструмента.
+
+        Returns:
+            True, если инструмент помечен декоратором cacheable.
+        """
+        record = self.tools.get(name)
+        return record is not None and bool(getattr(record.func, "__cacheable__", False))
 
     async def call_tool(self, name: str, **kwargs: Any) -> str:
         """
@@ -113,78 +267,31 @@ class ToolManager:
 
         Returns:
             Результат выполнения инструмента в виде строки.
+
+        Raises:
+            Exception: Ошибки инструмента, кроме неверных аргументов.
         """
         if name not in self.tools:
             return f"Ошибка: инструмент '{name}' не найден."
 
         try:
-            result = await self.tools[name](**kwargs)
-            return str(result)
-        except Exception as e:
+            result = await self.tools[name].func(**kwargs)
+        except TypeError as e:
+            # Неверные аргументы от LLM - обычная ошибка, о которой сообщаем агенту
             return f"Ошибка при выполнении инструмента '{name}': {str(e)}"
+        # Инструменты возвращают строки, str() нужен только для остальных типов
+        return result if type(result) is str else str(result)
 
     def get_tool_definitions(self) -> List[Dict[str, Any]]:
         """
-        Автоматически генерирует определения инструментов в формате OpenAI function calling.
+        Возвращает определения инструментов в формате OpenAI function calling.
 
-        Схемы генерируются на основе сигнатур функций и их docstrings.
+        Схемы строятся при регистрации (или заранее декоратором tool), список
+        кешируется до регистрации нового инструмента.
 
         Returns:
             Список определений функций для OpenAI API.
         """
-        definitions = []
-
-        for name, func in self.tools.items():
-            # Получаем сигнатуру функции
-            sig = inspect.signature(func)
-            # Парсим docstring
-            docstring_info = parse_google_docstring(func.__doc__ or "")
-
-            properties: Dict[str, Any] = {}
-            required: List[str] = []
-
-            # Обрабатываем параметры функции
-            for param_name, param in sig.parameters.items():
-                # Пропускаем служебные параметры
-                if param_name in ("self", "args", "kwargs"):
-                    continue
-
-                # Определяем тип параметра
-                param_type = python_type_to_json_type(param.annotation) if param.annotation != inspect.Parameter.empty else "string"
-
-                # Специальная обработка для enum-подобных типов (например, direction в scroll_page)
-                param_schema: Dict[str, Any] = {
-                    "type": param_type,
-                    "description": docstring_info["params"].get(param_name, ""),
-                }
-
-                # Если параметр имеет значения по умолчанию, добавляем их
-                if param.default != inspect.Parameter.empty:
-                    param_schema["default"] = param.default
-
-                properties[param_name] = param_schema
-
-                # Если параметр обязательный (нет значения по умолчанию)
-                if param.default == inspect.Parameter.empty:
-                    required.append(param_name)
-
-            # Специальные случаи для некоторых инструментов
-            if name == "scroll_page" and "direction" in properties:
-                properties["direction"]["enum"] = ["down", "up", "top", "bottom"]
-
-            tool_definition = {
-                "type": "function",
-                "function": {
-                    "name": name,
-                    "description": docstring_info["description"] or f"Выполняет действие: {name}",
-                    "parameters": {
-                        "type": "object",
-                        "properties": properties,
-                        "required": required,
-                    },
-                },
-            }
-
-            definitions.append(tool_definition)
-
-        return definitions
+        if self._definitions_cache is None:
+            self._definitions_cache = [record.schema for record in self.tools.values()]
+        return self._definitions_cache
@@ -8,6 +8,8 @@ def setup_logger(name: str = "ai_browser_agent", level: int = logging.INFO) -> l
     """
     Настраивает и возвращает логгер.
 
+    Повторный вызов возвращает уже настроенный логгер без пересоздания обработчиков.
+
     Args:
         name: Имя логгера.
         level: Уровень логирования.
@@ -18,8 +20,11 @@ def setup_logger(name: str = "ai_browser_agent", level: int = logging.INFO) -> l
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    # Удаляем существующие обработчики
-    logger.handlers.clear()
+    if logger.handlers:
+        return logger
+
+    # Записи выводятся только обработчиком этого логгера, без передачи корневому
+    logger.propagate = False
 
     # Создаем форматтер
     formatter = logging.Formatter(
@@ -0,0 +1,62 @@
+"""Отключение сбора стека вызовов в Playwright."""
+
+import inspect
+import os
+import traceback
+from typing import Any, List
+
+
+class _ModuleProxy:
+    """Проксирует атрибуты модуля, подменяя отдельные функции."""
+
+    def __init__(self, module: Any, **overrides: Any):
+        """
+        Создает прокси модуля.
+
+        Args:
+            module: Исходный модуль.
+            **overrides: Функции, которые нужно подменить.
+        """
+        self._module = module
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._module, name)
+
+
+def _empty_stack(*args: Any, **kwargs: Any) -> List[inspect.FrameInfo]:
+    return []
+
+
+def _empty_stack_summary(*args: Any, **kwargs: Any) -> traceback.StackSummary:
+    return traceback.StackSummary()
+
+
+def disable_playwright_stack_capture() -> bool:
+    """
+    Отключает сбор стека вызовов при каждом обращении к API Playwright.
+
+    Playwright вызывает inspect.stack() и traceback.extract_stack() на каждый вызов API,
+    чтобы подписывать вызовы в трейсах и сообщениях об ошибках. Это заметная часть
+    времени каждого действия агента. Патч подменяет эти функции только внутри модулей
+    Playwright; без стека в ошибках Playwright не будет строк вызывающего кода.
+
+    Патч включен по умолчанию, для отладки задайте AGENT_DISABLE_PW_STACK=0.
+
+    Returns:
+        True, если патч применен.
+    """
+    if os.getenv("AGENT_DISABLE_PW_STACK", "1") == "0":
+        return False
+
+    try:
+        from playwright._impl import _connection, _network
+    except ImportError:
+        return False
+
+    for module in (_connection, _network):
+        if hasattr(module, "inspect"):
+            module.inspect = _ModuleProxy(inspect, stack=_empty_stack)
+    if hasattr(_connection, "traceback"):
+        _connection.traceback = _ModuleProxy(traceback, extract_stack=_empty_stack_summary)
+    return True